@@ -10,133 +10,745 @@
 #    downstream risk management and automated remediation processes.
 # This review ensures the integrity and trustworthiness of the automated evidence.
 
+import concurrent.futures
+import dataclasses
 import json
-import boto3
+import logging
+import orjson
+from pythonjsonlogger import jsonlogger
+import botocore.config
+import botocore.session
+from botocore.exceptions import ClientError
 import datetime
 import os
-import requests
+import random
+import threading
+import time
+import urllib3
 
-def send_cce_to_vanguard(cce_payload):
+# Module-level clients are shared across worker threads and warm Lambda
+# invocations. Botocore clients are thread-safe; max_pool_connections is
+# raised above the worker count so concurrent calls don't serialize on the
+# underlying urllib3 connection pool.
+MAX_WORKERS = int(os.environ.get('MAX_WORKERS', '32'))
+
+# Structured, lazily-formatted logging: fields travel in `extra` so nothing
+# is interpolated when the level is filtered out, and CloudWatch Insights
+# can query the fields directly instead of regexing message text. The JSON
+# formatter is what actually renders the extra fields - Lambda's default
+# text format drops them, leaving bare event names in the log.
+def _configure_json_logging():
+    formatter = jsonlogger.JsonFormatter('%(levelname)s %(name)s %(message)s', timestamp=True)
+    root = logging.getLogger()
+    if root.handlers:
+        # Lambda pre-attaches a handler to the root logger; reuse it.
+        for handler in root.handlers:
+            handler.setFormatter(formatter)
+    else:
+        handler = logging.StreamHandler()
+        handler.setFormatter(formatter)
+        root.addHandler(handler)
+
+_configure_json_logging()
+
+logger = logging.getLogger(__name__)
+logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO'))
+
+_BOTO_CONFIG = botocore.config.Config(
+    # The pool must be at least as wide as the check-level fan-out
+    # (MAX_WORKERS * 2), or workers serialize on connection checkouts and
+    # churn discarded connections through fresh TLS handshakes.
+    max_pool_connections=MAX_WORKERS * 2,
+    connect_timeout=2,
+    read_timeout=5,
+    # Keep pooled connections alive between warm invocations so reused
+    # containers skip the TCP/TLS handshake entirely.
+    tcp_keepalive=True,
+    retries={'max_attempts': 3, 'mode': 'adaptive'}
+)
+
+# Clients come straight from a botocore session: importing boto3 drags in
+# its resource layer and session machinery for ~100ms of extra cold start,
+# while the low-level clients used here are botocore's own.
+_BOTO_SESSION = botocore.session.Session()
+
+BOTO3_CLIENTS = {
+    's3': _BOTO_SESSION.create_client('s3', config=_BOTO_CONFIG),
+    'sqs': _BOTO_SESSION.create_client('sqs', config=_BOTO_CONFIG),
+    'config': _BOTO_SESSION.create_client('config', config=_BOTO_CONFIG),
+}
+
+# When set, bucket compliance is answered from an AWS Config aggregator in
+# one paginated query instead of 2N S3 control-plane round-trips.
+CONFIG_AGGREGATOR_NAME = os.environ.get('CONFIG_AGGREGATOR_NAME')
+
+# SECURITY_HUB_ENABLED=1 mirrors every finding into Security Hub as ASFF
+# records; the client is only constructed when the integration is on.
+SECURITY_HUB_ENABLED = os.environ.get('SECURITY_HUB_ENABLED') == '1'
+if SECURITY_HUB_ENABLED:
+    BOTO3_CLIENTS['securityhub'] = _BOTO_SESSION.create_client('securityhub', config=_BOTO_CONFIG)
+
+# S3 has enforced SSE-S3 default encryption on every bucket since January
+# 2023, so probing all N buckets doubles the scan's round-trips only to
+# confirm a platform guarantee. Positive proof is instead collected from a
+# rotating random sample of this many buckets per scan (0 disables probing).
+ENCRYPTION_SAMPLE_SIZE = int(os.environ.get('ENCRYPTION_SAMPLE_SIZE', '50'))
+
+# FULL_SCAN=1 forces the exhaustive account scan even when the invocation
+# carries an AWS Config compliance-change event; used for reconciliation
+# runs, since the event-driven path only does O(1) work per change.
+FULL_SCAN = os.environ.get('FULL_SCAN') == '1'
+
+def _strip_bucket_creation_date(client):
+    """
+    Drops CreationDate from the client's ListBuckets response model so the
+    response parser skips per-bucket datetime parsing, which dominates the
+    Python-side cost of listing large accounts. This module only ever
+    consumes bucket names. Best-effort: if botocore's internals move, the
+    stock model is kept and we just pay the parse cost again.
+    """
+    try:
+        output_shape = client.meta.service_model.operation_model('ListBuckets').output_shape
+        output_shape.members['Buckets'].member.members.pop('CreationDate', None)
+    except Exception:
+        logger.debug('creation_date_strip_unavailable')
+
+_strip_bucket_creation_date(BOTO3_CLIENTS['s3'])
+
+def _prime_connections():
     """
-    Securely sends the CCE payload to the Vanguard_Agent API endpoint.
+    Issues a minimal ListBuckets so the shared S3 client's TCP/TLS pool is
+    already warm when a SnapStart checkpoint is taken; restored containers
+    then skip the first-call handshake.
     """
+    try:
+        BOTO3_CLIENTS['s3'].list_buckets(MaxBuckets=1)
+    except Exception:
+        logger.debug('connection_prime_failed')
+
+try:
+    from snapshot_restore_py import register_before_snapshot
+    register_before_snapshot(_prime_connections)
+except ImportError:
+    # Not running under SnapStart; pools warm up on first use instead.
+    pass
+
+# Separate pool for the individual checks within a bucket, so the checks for
+# one bucket overlap each other (~1 RTT per bucket instead of one per check).
+# A distinct pool avoids deadlocking the bucket-level workers, which block on
+# these futures. Sized with the bucket pool so raising MAX_WORKERS lifts
+# both levels of the fan-out together.
+CHECK_EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS * 2)
+
+# One keep-alive pool for all Vanguard POSTs, talking to urllib3 directly
+# rather than through requests: the requests import alone costs 10-30ms of
+# cold start, and everything this module needs from it (connection pooling,
+# retries) lives in urllib3, which botocore already pulls in anyway.
+POOL = urllib3.PoolManager(
+    num_pools=4,
+    maxsize=32,
+    # Retries are handled transparently by the pool: POST is explicitly
+    # allowed (urllib3 excludes it by default) and Vanguard's Retry-After
+    # header is honored on 429s, so concurrent workers back off in parallel
+    # instead of serializing hand-rolled retry loops.
+    retries=urllib3.Retry(
+        total=3,
+        backoff_factor=0.25,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=['POST'],
+        respect_retry_after_header=True
+    )
+)
+
+# Headers shared by every Vanguard POST; the bearer token is added once the
+# first delivery reads it from the environment.
+_VANGUARD_HEADERS = {'Content-Type': 'application/json'}
+
+# Bucket inventories change slowly, so warm Lambda containers reuse the last
+# listing for BUCKETS_TTL seconds instead of re-listing every invocation.
+BUCKETS_TTL_SECONDS = int(os.environ.get('BUCKETS_TTL', '300'))
+_BUCKETS_CACHE = {'ts': 0.0, 'buckets': []}
+
+# The listing is also spilled to /tmp, which survives execution-environment
+# reuse that resets module state (e.g. a handler re-import), keyed on file
+# mtime for the same TTL.
+_BUCKETS_CACHE_FILE = '/tmp/ksi_buckets.json'
+
+def _load_bucket_cache_from_tmp():
+    """Seeds the in-memory bucket cache from /tmp if a fresh spill exists."""
+    try:
+        age = time.time() - os.path.getmtime(_BUCKETS_CACHE_FILE)
+        if age < BUCKETS_TTL_SECONDS:
+            with open(_BUCKETS_CACHE_FILE, 'rb') as f:
+                _BUCKETS_CACHE['buckets'] = orjson.loads(f.read())
+            _BUCKETS_CACHE['ts'] = time.monotonic() - age
+    except (OSError, ValueError):
+        pass
+
+def _iter_bucket_names(s3_client):
+    """
+    Yields bucket names, serving from the warm-container cache when it is
+    fresh. On a refresh, names are yielded per listing page so downstream
+    checks overlap the remainder of the listing, then the full list is
+    cached for subsequent invocations within the TTL.
+    """
+    if not _BUCKETS_CACHE['buckets']:
+        _load_bucket_cache_from_tmp()
+    if _BUCKETS_CACHE['buckets'] and time.monotonic() - _BUCKETS_CACHE['ts'] < BUCKETS_TTL_SECONDS:
+        yield from _BUCKETS_CACHE['buckets']
+        return
+
+    paginate_kwargs = {'PaginationConfig': {'PageSize': 1000}}
+    region = os.environ.get('AWS_REGION')
+    if region:
+        # Let S3 filter the listing to buckets homed in this region, so the
+        # per-bucket checks are never routed cross-region and never pay the
+        # PermanentRedirect-then-retry dance.
+        paginate_kwargs['BucketRegion'] = region
+
+    names = []
+    paginator = s3_client.get_paginator('list_buckets')
+    for page in paginator.paginate(**paginate_kwargs):
+        for bucket in page.get('Buckets', []):
+            names.append(bucket['Name'])
+            yield bucket['Name']
+
+    _BUCKETS_CACHE['buckets'] = names
+    _BUCKETS_CACHE['ts'] = time.monotonic()
+    try:
+        with open(_BUCKETS_CACHE_FILE, 'wb') as f:
+            f.write(orjson.dumps(names))
+    except OSError:
+        logger.debug('bucket_cache_write_failed')
+
+# Cap on the serialized size of one batched POST to Vanguard.
+MAX_BATCH_BYTES = 1024 * 1024
+
+def _post_cce_batch(api_url, batch):
+    """POSTs one chunk of CCE payloads to Vanguard."""
+    try:
+        # orjson emits bytes directly, so the body goes straight onto the
+        # wire without an intermediate str->bytes encode.
+        response = POOL.request(
+            'POST',
+            api_url,
+            body=orjson.dumps({'batch': batch}),
+            headers=_VANGUARD_HEADERS,
+            timeout=30.0
+        )
+        if response.status >= 400:
+            logger.error('cce_batch_rejected', extra={'batch_size': len(batch), 'status': response.status})
+            return
+        logger.info('cce_batch_sent', extra={'batch_size': len(batch), 'status': response.status})
+    except urllib3.exceptions.HTTPError as e:
+        logger.error('cce_batch_failed', extra={'batch_size': len(batch), 'error': str(e)})
+
+def send_cce_to_vanguard_bulk(cce_payloads):
+    """
+    Securely sends all CCE payloads for an invocation to the Vanguard_Agent
+    API endpoint in batched POSTs, chunked to stay under MAX_BATCH_BYTES.
+    One request per ~1MB of evidence replaces one request per bucket.
+    """
+    if not cce_payloads:
+        return
+
     api_url = os.environ.get('VANGUARD_AGENT_API_URL')
     api_key = os.environ.get('VANGUARD_API_KEY')
 
     if not api_url or not api_key:
-        print("ERROR: VANGUARD_AGENT_API_URL and VANGUARD_API_KEY environment variables must be set.")
+        logger.error('config_missing', extra={'variables': ['VANGUARD_AGENT_API_URL', 'VANGUARD_API_KEY']})
         return
 
-    headers = {
-        'Authorization': f'Bearer {api_key}',
-        'Content-Type': 'application/json'
-    }
+    # Set the bearer token on the shared headers once; env vars are fixed
+    # for the lifetime of the Lambda container.
+    _VANGUARD_HEADERS.setdefault('Authorization', f'Bearer {api_key}')
 
-    try:
-        response = requests.post(api_url, headers=headers, json=cce_payload, timeout=10)
-        response.raise_for_status()
-        print(f"Successfully sent CCE to Vanguard for target {cce_payload['target_id']}. Status: {response.status_code}")
-    except requests.exceptions.RequestException as e:
-        print(f"ERROR: Failed to send CCE to Vanguard for target {cce_payload['target_id']}: {e}")
+    # Bind the per-payload lookups to locals; global and attribute lookups
+    # inside the loop add up once thousands of payloads flow through.
+    dumps = orjson.dumps
+    post_batch = _post_cce_batch
+
+    batch = []
+    batch_bytes = 0
+    for payload in cce_payloads:
+        payload_bytes = len(dumps(payload))
+        if batch and batch_bytes + payload_bytes > MAX_BATCH_BYTES:
+            post_batch(api_url, batch)
+            batch = []
+            batch_bytes = 0
+        batch.append(payload)
+        batch_bytes += payload_bytes
+    post_batch(api_url, batch)
+
+# SendMessageBatch accepts at most 10 entries per call.
+SQS_BATCH_SIZE = 10
+
+REMEDIATION_PATH = 'https://github.com/wrestcody/Praetorium_Nexus/blob/main/remediation_playbooks/s3_public_access_fix.tf'
+
+# Fields that are identical in every CCE payload, built once at import and
+# copied into each payload with a single dict unpack instead of key-by-key
+# assignments per bucket.
+_PAYLOAD_TEMPLATE = {
+    'engine_id': 'KSI_Engine',
+    'control_id': 'NIST-800-53-CM-6',
+    'remediation_path': REMEDIATION_PATH
+}
 
-def trigger_remediation(bucket_arn):
+def _remediation_message(bucket_arn, timestamp):
+    """Builds the SQS message body that triggers a remediation playbook."""
+    return {
+        'target_id': bucket_arn,
+        'remediation_path': REMEDIATION_PATH,
+        'timestamp': timestamp
+    }
+
+def trigger_remediation_batch(bucket_arns, timestamp):
     """
-    Sends a message to an SQS queue to trigger a downstream remediation playbook.
+    Sends remediation triggers for all failing buckets to the SQS queue in
+    batches of up to 10 (the SendMessageBatch maximum), retrying any entries
+    the batch call reports as failed individually.
     """
+    if not bucket_arns:
+        return
+
     sqs_queue_url = os.environ.get('SQS_QUEUE_URL')
     if not sqs_queue_url:
-        print("ERROR: SQS_QUEUE_URL environment variable must be set.")
+        logger.error('config_missing', extra={'variables': ['SQS_QUEUE_URL']})
         return
 
-    sqs = boto3.client('sqs')
-    message_body = {
-        'target_id': bucket_arn,
-        'remediation_path': 'https://github.com/wrestcody/Praetorium_Nexus/blob/main/remediation_playbooks/s3_public_access_fix.tf',
-        'timestamp': datetime.datetime.utcnow().isoformat()
-    }
+    sqs = BOTO3_CLIENTS['sqs']
+    for start in range(0, len(bucket_arns), SQS_BATCH_SIZE):
+        chunk = bucket_arns[start:start + SQS_BATCH_SIZE]
+        entries = [
+            {'Id': str(i), 'MessageBody': orjson.dumps(_remediation_message(arn, timestamp)).decode()}
+            for i, arn in enumerate(chunk)
+        ]
 
-    try:
-        response = sqs.send_message(
-            QueueUrl=sqs_queue_url,
-            MessageBody=json.dumps(message_body)
+        try:
+            response = sqs.send_message_batch(QueueUrl=sqs_queue_url, Entries=entries)
+        except Exception as e:
+            logger.error('remediation_batch_failed', extra={'targets': chunk, 'error': str(e)})
+            continue
+
+        sent = len(response.get('Successful', []))
+        logger.info('remediation_batch_sent', extra={'sent': sent})
+
+        # Retry entries the service rejected individually so one bad entry
+        # doesn't drop the rest of the chunk.
+        for failure in response.get('Failed', []):
+            arn = chunk[int(failure['Id'])]
+            try:
+                sqs.send_message(
+                    QueueUrl=sqs_queue_url,
+                    MessageBody=orjson.dumps(_remediation_message(arn, timestamp)).decode()
+                )
+                logger.info('remediation_retry_sent', extra={'target_id': arn})
+            except Exception as e:
+                logger.error('remediation_retry_failed', extra={'target_id': arn, 'error': str(e)})
+
+# The four Public Access Block settings that must all be enabled for a
+# bucket to be compliant.
+_PAB_KEYS = ('BlockPublicAcls', 'IgnorePublicAcls', 'BlockPublicPolicy', 'RestrictPublicBuckets')
+
+# Details for error codes each check knows how to interpret; anything else
+# still yields a FAIL finding naming the code, so no bucket is silently
+# dropped from the evidence.
+_PAB_ERROR_DETAILS = {
+    'NoSuchPublicAccessBlockConfiguration': "Public access block configuration is missing.",
+}
+_SSE_ERROR_DETAILS = {
+    'ServerSideEncryptionConfigurationNotFoundError': "Default encryption configuration is missing.",
+}
+
+@dataclasses.dataclass(slots=True)
+class Finding:
+    """
+    Result of one compliance check. A fixed-shape slotted struct is cheaper
+    to allocate than a per-check dict (no hash table per instance), and
+    orjson serializes dataclasses natively so the emitted JSON is unchanged.
+    """
+    check_id: str
+    status: str
+    details: str
+
+# Error codes that mean the bucket cannot be audited at all, so further API
+# calls against it would just re-discover the same failure one RTT at a time.
+_DEAD_BUCKET_CODES = frozenset(('AccessDenied', 'NoSuchBucket', 'PermanentRedirect'))
+
+class BucketUnreachableError(Exception):
+    """
+    Raised when a bucket is unreachable (deleted, cross-region redirect, or
+    access denied). Checks catch this and synthesize a FAIL finding without
+    issuing any more API calls for the bucket.
+    """
+
+    def __init__(self, code):
+        super().__init__(code)
+        self.code = code
+
+@dataclasses.dataclass
+class BucketContext:
+    """
+    Per-bucket view of the S3 API responses the checks consume. Each response
+    is fetched lazily and cached, so checks that share an underlying API call
+    (including checks added later, e.g. a public-policy check that also needs
+    the public access block) never re-fetch it. Fetches for distinct APIs use
+    distinct locks so concurrent checks don't serialize on each other.
+    """
+    s3_client: object
+    bucket_name: str
+    _cache: dict = dataclasses.field(default_factory=dict, repr=False)
+    _locks: dict = dataclasses.field(default_factory=dict, repr=False)
+    _master_lock: threading.Lock = dataclasses.field(default_factory=threading.Lock, repr=False)
+    _dead_code: str = dataclasses.field(default=None, repr=False)
+
+    def _fetch(self, key, fetcher):
+        if self._dead_code is not None:
+            raise BucketUnreachableError(self._dead_code)
+        if key in self._cache:
+            return self._cache[key]
+        with self._master_lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            if key not in self._cache:
+                try:
+                    self._cache[key] = fetcher()
+                except ClientError as e:
+                    code = e.response['Error']['Code']
+                    if code in _DEAD_BUCKET_CODES:
+                        self._dead_code = code
+                        raise BucketUnreachableError(code) from e
+                    raise
+        return self._cache[key]
+
+    @property
+    def public_access_block(self):
+        """Raw GetPublicAccessBlock response, fetched at most once."""
+        return self._fetch(
+            'public_access_block',
+            lambda: self.s3_client.get_public_access_block(Bucket=self.bucket_name)
         )
-        print(f"Successfully sent remediation trigger for {bucket_arn}. Message ID: {response.get('MessageId')}")
-    except Exception as e:
-        print(f"ERROR: Failed to send remediation trigger for {bucket_arn}: {e}")
 
-def check_public_access_block(s3_client, bucket_name):
+    @property
+    def encryption(self):
+        """Raw GetBucketEncryption response, fetched at most once."""
+        return self._fetch(
+            'encryption',
+            lambda: self.s3_client.get_bucket_encryption(Bucket=self.bucket_name)
+        )
+
+def check_public_access_block(ctx):
     """Checks if a bucket's Public Access Block is fully enabled."""
     try:
-        config = s3_client.get_public_access_block(Bucket=bucket_name)['PublicAccessBlockConfiguration']
-        is_compliant = all([
-            config.get('BlockPublicAcls', False),
-            config.get('IgnorePublicAcls', False),
-            config.get('BlockPublicPolicy', False),
-            config.get('RestrictPublicBuckets', False)
-        ])
+        config = ctx.public_access_block['PublicAccessBlockConfiguration']
+        is_compliant = all(config.get(key, False) for key in _PAB_KEYS)
         details = "Public access block is enabled." if is_compliant else "Public access block is not fully enabled."
-        return {"check_id": "S3.1_Public_Access_Blocked", "status": "PASS" if is_compliant else "FAIL", "details": details}
-    except s3_client.exceptions.ClientError as e:
-        if e.response['Error']['Code'] == 'NoSuchPublicAccessBlockConfiguration':
-            return {"check_id": "S3.1_Public_Access_Blocked", "status": "FAIL", "details": "Public access block configuration is missing."}
-        raise
+        return Finding("S3.1_Public_Access_Blocked", "PASS" if is_compliant else "FAIL", details)
+    except BucketUnreachableError as e:
+        return Finding("S3.1_Public_Access_Blocked", "FAIL", f"Bucket could not be audited ({e.code}).")
+    except ClientError as e:
+        code = e.response['Error']['Code']
+        return Finding("S3.1_Public_Access_Blocked", "FAIL",
+                       _PAB_ERROR_DETAILS.get(code, f"Bucket could not be audited ({code})."))
 
-def check_default_encryption(s3_client, bucket_name):
+def check_default_encryption(ctx):
     """Checks if a bucket has default server-side encryption enabled."""
     try:
-        encryption = s3_client.get_bucket_encryption(Bucket=bucket_name)
+        encryption = ctx.encryption
         is_compliant = bool(encryption.get('ServerSideEncryptionConfiguration', {}).get('Rules'))
         details = "Default encryption (AES256 or KMS) is enabled." if is_compliant else "Default encryption is not enabled."
-        return {"check_id": "S3.5_Server_Side_Encryption", "status": "PASS" if is_compliant else "FAIL", "details": details}
-    except s3_client.exceptions.ClientError as e:
-        if e.response['Error']['Code'] == 'ServerSideEncryptionConfigurationNotFoundError':
-            return {"check_id": "S3.5_Server_Side_Encryption", "status": "FAIL", "details": "Default encryption configuration is missing."}
-        raise
+        return Finding("S3.5_Server_Side_Encryption", "PASS" if is_compliant else "FAIL", details)
+    except BucketUnreachableError as e:
+        return Finding("S3.5_Server_Side_Encryption", "FAIL", f"Bucket could not be audited ({e.code}).")
+    except ClientError as e:
+        code = e.response['Error']['Code']
+        return Finding("S3.5_Server_Side_Encryption", "FAIL",
+                       _SSE_ERROR_DETAILS.get(code, f"Bucket could not be audited ({code})."))
+
+def process_bucket(s3_client, bucket_name, invocation_ts, verify_encryption=True):
+    """
+    Runs all compliance checks for a single bucket and returns the
+    consolidated CCE payload for batched delivery. All evidence from one
+    invocation shares one timestamp: one scan is one point-in-time. When
+    verify_encryption is false, the encryption finding relies on S3's
+    account-wide SSE-S3 enforcement instead of a per-bucket probe.
+    """
+    bucket_arn = f"arn:aws:s3:::{bucket_name}"
+    ctx = BucketContext(s3_client, bucket_name)
+
+    # Aggregate findings from all checks for the bucket. The checks are
+    # independent S3 round-trips, so run them concurrently.
+    check_futures = [CHECK_EXECUTOR.submit(check_public_access_block, ctx)]
+    if verify_encryption:
+        check_futures.append(CHECK_EXECUTOR.submit(check_default_encryption, ctx))
+
+    # Collect findings and derive the bucket's overall status in the same
+    # pass, rather than building the list and then re-scanning it.
+    findings = []
+    overall_status = "PASS"
+    for future in check_futures:
+        finding = future.result()
+        findings.append(finding)
+        if finding.status == 'FAIL':
+            overall_status = "FAIL"
+
+    if not verify_encryption:
+        findings.append(Finding(
+            "S3.5_Server_Side_Encryption",
+            "PASS",
+            "Default encryption (SSE-S3 baseline) is enforced by S3 on all buckets; positive proof is sampled on rotation."
+        ))
+
+    # Each worker emits its bucket's evidence event as it finishes, so logs
+    # stream to CloudWatch while other buckets are still being checked
+    # instead of piling up behind the batched delivery. Guarded: building
+    # the event is wasted work above DEBUG.
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug('bucket_evidence', extra={'target_id': bucket_arn, 'bucket_status': overall_status})
+
+    # Return the fully-built CCE payload directly
+    return {
+        **_PAYLOAD_TEMPLATE,
+        "timestamp": invocation_ts,
+        "target_id": bucket_arn,
+        "status": overall_status,
+        "findings": findings
+    }
+
+# AWS Config records the Public Access Block settings in camelCase.
+_CONFIG_PAB_KEYS = ('blockPublicAcls', 'ignorePublicAcls', 'blockPublicPolicy', 'restrictPublicBuckets')
+
+_CONFIG_QUERY = (
+    "SELECT resourceId, configuration.publicAccessBlockConfiguration, "
+    "supplementaryConfiguration.ServerSideEncryptionConfiguration "
+    "WHERE resourceType = 'AWS::S3::Bucket'"
+)
+
+def payloads_from_config_aggregator(invocation_ts):
+    """
+    Fast path: answers both checks for every bucket from one paginated AWS
+    Config aggregator query instead of 1 + 2N S3 control-plane round-trips.
+    Returns None if the aggregator is unavailable so the caller can fall
+    back to the direct per-bucket scan.
+    """
+    config_client = BOTO3_CLIENTS['config']
+    query_kwargs = {
+        'Expression': _CONFIG_QUERY,
+        'ConfigurationAggregatorName': CONFIG_AGGREGATOR_NAME
+    }
+
+    cce_payloads = []
+    # Local bindings for the per-result work; the loop below runs once per
+    # bucket in the aggregator.
+    loads = orjson.loads
+    append_payload = cce_payloads.append
+    select = config_client.select_aggregate_resource_config
+    try:
+        while True:
+            response = select(**query_kwargs)
+            for raw_result in response.get('Results', []):
+                item = loads(raw_result)
+
+                pab = (item.get('configuration') or {}).get('publicAccessBlockConfiguration') or {}
+                pab_compliant = all(pab.get(key, False) for key in _CONFIG_PAB_KEYS)
+                pab_details = "Public access block is enabled." if pab_compliant else "Public access block is not fully enabled."
+
+                sse = (item.get('supplementaryConfiguration') or {}).get('ServerSideEncryptionConfiguration') or {}
+                sse_compliant = bool(sse.get('rules') or sse.get('Rules'))
+                sse_details = "Default encryption (AES256 or KMS) is enabled." if sse_compliant else "Default encryption is not enabled."
+
+                append_payload({
+                    **_PAYLOAD_TEMPLATE,
+                    "timestamp": invocation_ts,
+                    "target_id": f"arn:aws:s3:::{item['resourceId']}",
+                    "status": "PASS" if pab_compliant and sse_compliant else "FAIL",
+                    "findings": [
+                        Finding("S3.1_Public_Access_Blocked", "PASS" if pab_compliant else "FAIL", pab_details),
+                        Finding("S3.5_Server_Side_Encryption", "PASS" if sse_compliant else "FAIL", sse_details)
+                    ]
+                })
+
+            next_token = response.get('NextToken')
+            if not next_token:
+                return cce_payloads
+            query_kwargs['NextToken'] = next_token
+    except Exception as e:
+        logger.error('config_aggregator_failed', extra={'aggregator': CONFIG_AGGREGATOR_NAME, 'error': str(e)})
+        return None
+
+# BatchImportFindings accepts at most 100 findings per call.
+SECURITY_HUB_BATCH_SIZE = 100
+
+def _account_id_from_context(context):
+    """Extracts the account id from the function ARN in the Lambda context."""
+    parts = getattr(context, 'invoked_function_arn', '').split(':')
+    return parts[4] if len(parts) > 4 else None
+
+def send_findings_to_security_hub(cce_payloads, account_id):
+    """
+    Mirrors the invocation's findings into Security Hub as ASFF records via
+    batch_import_findings, 100 per call (the API maximum), with the chunk
+    uploads running in parallel on the shared check executor so upload
+    parallelism matches the probe fan-out.
+    """
+    if not cce_payloads or not account_id:
+        return
+
+    region = os.environ.get('AWS_REGION', 'us-east-1')
+    product_arn = f"arn:aws:securityhub:{region}:{account_id}:product/{account_id}/default"
+
+    asff_findings = []
+    for payload in cce_payloads:
+        for finding in payload['findings']:
+            asff_findings.append({
+                'SchemaVersion': '2018-10-08',
+                'Id': f"{payload['target_id']}/{finding.check_id}",
+                'ProductArn': product_arn,
+                'GeneratorId': f"KSI_Engine/{finding.check_id}",
+                'AwsAccountId': account_id,
+                'Types': ['Software and Configuration Checks/Industry and Regulatory Standards'],
+                'CreatedAt': payload['timestamp'],
+                'UpdatedAt': payload['timestamp'],
+                'Severity': {'Label': 'HIGH' if finding.status == 'FAIL' else 'INFORMATIONAL'},
+                'Title': finding.check_id,
+                'Description': finding.details,
+                'Resources': [{'Type': 'AwsS3Bucket', 'Id': payload['target_id']}],
+                'Compliance': {'Status': 'PASSED' if finding.status == 'PASS' else 'FAILED'}
+            })
+
+    securityhub = BOTO3_CLIENTS['securityhub']
+
+    def _import_chunk(chunk):
+        try:
+            response = securityhub.batch_import_findings(Findings=chunk)
+            if response.get('FailedCount'):
+                logger.error('securityhub_import_partial', extra={'failed': response['FailedCount']})
+        except Exception as e:
+            logger.error('securityhub_import_failed', extra={'batch_size': len(chunk), 'error': str(e)})
+
+    chunks = [
+        asff_findings[start:start + SECURITY_HUB_BATCH_SIZE]
+        for start in range(0, len(asff_findings), SECURITY_HUB_BATCH_SIZE)
+    ]
+    # Drain the map so every upload finishes before the handler returns.
+    list(CHECK_EXECUTOR.map(_import_chunk, chunks))
+
+def _payload_from_compliance_event(event, invocation_ts):
+    """
+    Builds a CCE payload from an EventBridge AWS Config compliance-change
+    event, turning the steady state into O(1) work per changed bucket:
+    Config evaluates the rules server-side and pushes only the deltas here.
+    Returns None when the invocation doesn't carry such an event (e.g. a
+    scheduled run), so the caller falls through to the exhaustive scan.
+    """
+    detail = (event or {}).get('detail') or {}
+    if detail.get('messageType') != 'ComplianceChangeNotification':
+        return None
+
+    # Only S3 bucket rules may flow through here: fabricating an S3 ARN for
+    # another resource type would enqueue the S3 remediation playbook
+    # against something that isn't a bucket.
+    if detail.get('resourceType') != 'AWS::S3::Bucket':
+        return None
+
+    resource_id = detail.get('resourceId')
+    compliance = (detail.get('newEvaluationResult') or {}).get('complianceType')
+    if not resource_id or compliance not in ('COMPLIANT', 'NON_COMPLIANT'):
+        return None
+
+    status = "PASS" if compliance == 'COMPLIANT' else "FAIL"
+    rule_name = detail.get('configRuleName', 'aws_config_rule')
+    return {
+        **_PAYLOAD_TEMPLATE,
+        "timestamp": invocation_ts,
+        "target_id": f"arn:aws:s3:::{resource_id}",
+        "status": status,
+        "findings": [Finding(rule_name, status, f"AWS Config rule evaluation: {compliance}.")]
+    }
 
 def lambda_handler(event, context):
     """
     Checks S3 buckets for compliance, generates a consolidated CCE payload,
-    sends it to Vanguard, and triggers remediation if necessary.
+    sends it to Vanguard, and triggers remediation if necessary. When
+    invoked with an AWS Config compliance-change event, only the changed
+    bucket is processed; scheduled or FULL_SCAN invocations scan the
+    account.
     """
-    s3 = boto3.client('s3')
+    s3 = BOTO3_CLIENTS['s3']
     processed_buckets = 0
 
+    # One timestamp for the whole invocation: cheaper than re-formatting per
+    # bucket, and semantically correct (one scan = one evidence point-in-time).
+    # now(timezone.utc) rather than the deprecated utcnow(); keep the Z suffix
+    # downstream consumers expect.
+    invocation_ts = datetime.datetime.now(datetime.timezone.utc).isoformat().replace('+00:00', 'Z')
+
     try:
-        for bucket in s3.list_buckets().get('Buckets', []):
-            bucket_name = bucket['Name']
-            bucket_arn = f"arn:aws:s3:::{bucket_name}"
-
-            # Aggregate findings from all checks for the bucket
-            findings = [
-                check_public_access_block(s3, bucket_name),
-                check_default_encryption(s3, bucket_name)
-            ]
-
-            # Determine the overall status for the bucket
-            overall_status = "PASS" if all(f['status'] == 'PASS' for f in findings) else "FAIL"
-
-            # Construct the final CCE payload
-            cce_payload = {
-                "engine_id": "KSI_Engine",
-                "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
-                "target_id": bucket_arn,
-                "control_id": "NIST-800-53-CM-6",
-                "status": overall_status,
-                "findings": findings,
-                "remediation_path": "https://github.com/wrestcody/Praetorium_Nexus/blob/main/remediation_playbooks/s3_public_access_fix.tf"
-            }
-
-            # Send the payload to the downstream agent
-            send_cce_to_vanguard(cce_payload)
-
-            # If the overall status is a failure, trigger one remediation action
-            if overall_status == "FAIL":
-                trigger_remediation(bucket_arn)
-
-            processed_buckets += 1
+        # Event-driven steady state: process just the bucket whose
+        # compliance changed and skip the account-wide fan-out entirely.
+        if not FULL_SCAN:
+            event_payload = _payload_from_compliance_event(event, invocation_ts)
+            if event_payload is not None:
+                send_cce_to_vanguard_bulk([event_payload])
+                # Compliance changes are exactly the findings Security Hub
+                # should track, so mirror them here too, not just full scans.
+                if SECURITY_HUB_ENABLED:
+                    send_findings_to_security_hub([event_payload], _account_id_from_context(context))
+                if event_payload['status'] == "FAIL":
+                    trigger_remediation_batch([event_payload['target_id']], invocation_ts)
+                return {
+                    'statusCode': 200,
+                    'body': json.dumps({'message': 'Successfully processed 1 compliance change event.'})
+                }
+
+        # Prefer answering every bucket from the AWS Config aggregator in
+        # one query; fall back to probing buckets directly if it fails.
+        cce_payloads = None
+        if CONFIG_AGGREGATOR_NAME:
+            cce_payloads = payloads_from_config_aggregator(invocation_ts)
+
+        if cce_payloads is None:
+            # The direct scan is network-latency bound (2-3 S3 round-trips
+            # per bucket), so fan buckets out across a thread pool to
+            # overlap RTTs.
+            # Only a rotating sample of buckets gets the encryption probe;
+            # the rest inherit S3's platform-level SSE guarantee. Each name
+            # gets an independent Bernoulli draw sized from the last known
+            # inventory count, so names keep streaming from the paginator
+            # into the pool instead of being materialized for random.sample.
+            # A cold container with no cached count probes every bucket once
+            # and samples from the next scan on.
+            if not _BUCKETS_CACHE['buckets']:
+                _load_bucket_cache_from_tmp()
+            known_total = len(_BUCKETS_CACHE['buckets'])
+            sample_rate = min(1.0, ENCRYPTION_SAMPLE_SIZE / known_total) if known_total else 1.0
+
+            with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+                futures = [
+                    executor.submit(process_bucket, s3, bucket_name, invocation_ts, random.random() < sample_rate)
+                    for bucket_name in _iter_bucket_names(s3)
+                ]
+                # Every result is needed before the batched delivery below,
+                # so collect futures in submission order: the comprehension
+                # presizes from the futures list (no append/realloc) and
+                # skips as_completed's wait bookkeeping.
+                cce_payloads = [future.result() for future in futures]
+        processed_buckets = len(cce_payloads)
+
+        # Deliver all evidence for the invocation in batched POSTs instead
+        # of one request per bucket.
+        send_cce_to_vanguard_bulk(cce_payloads)
+
+        # Mirror the findings into Security Hub when the integration is on.
+        if SECURITY_HUB_ENABLED:
+            send_findings_to_security_hub(cce_payloads, _account_id_from_context(context))
+
+        # Trigger remediation for every failing bucket in batched SQS sends.
+        failing_arns = [p['target_id'] for p in cce_payloads if p['status'] == 'FAIL']
+        trigger_remediation_batch(failing_arns, invocation_ts)
 
     except Exception as e:
-        print(f"An unexpected error occurred during bucket processing: {e}")
+        logger.exception('bucket_processing_failed')
         return {'statusCode': 500, 'body': json.dumps({'error': str(e)})}
 
     return {
@@ -54,6 +54,18 @@ data "aws_iam_policy_document" "lambda_policy" {
     actions   = ["sqs:SendMessage"]
     resources = [aws_sqs_queue.remediation_trigger_queue.arn]
   }
+
+  # Required for the AWS Config aggregator fast path
+  statement {
+    actions   = ["config:SelectAggregateResourceConfig"]
+    resources = ["*"]
+  }
+
+  # Required for mirroring findings into Security Hub
+  statement {
+    actions   = ["securityhub:BatchImportFindings"]
+    resources = ["*"]
+  }
 }
 
 resource "aws_iam_policy" "lambda_policy" {
@@ -66,10 +78,34 @@ resource "aws_iam_role_policy_attachment" "lambda_policy_attachment" {
   policy_arn = aws_iam_policy.lambda_policy.arn
 }
 
+# Builds the deployment package: the handler plus pinned dependencies from
+# requirements.txt. The checker relies on 2024+ botocore (ListBuckets
+# pagination, MaxBuckets/BucketRegion) and on orjson, neither of which is
+# available in the runtime's bundled SDK, so they must ship in the zip.
+resource "null_resource" "build_python_package" {
+  triggers = {
+    source       = filesha256("${path.module}/compliance_checker.py")
+    requirements = filesha256("${path.module}/requirements.txt")
+  }
+
+  provisioner "local-exec" {
+    command = <<-EOT
+      rm -rf ${path.module}/build
+      mkdir -p ${path.module}/build
+      pip install --target ${path.module}/build \
+        --platform manylinux2014_x86_64 --implementation cp \
+        --python-version 3.12 --only-binary=:all: \
+        -r ${path.module}/requirements.txt
+      cp ${path.module}/compliance_checker.py ${path.module}/build/
+    EOT
+  }
+}
+
 data "archive_file" "zip_python_code" {
   type        = "zip"
-  source_file = "compliance_checker.py"
+  source_dir  = "${path.module}/build"
   output_path = "compliance_checker.zip"
+  depends_on  = [null_resource.build_python_package]
 }
 
 resource "aws_lambda_function" "s3_compliance_checker" {
@@ -77,7 +113,7 @@ resource "aws_lambda_function" "s3_compliance_checker" {
   function_name    = "s3_compliance_checker"
   role             = aws_iam_role.iam_for_lambda.arn
   handler          = "compliance_checker.lambda_handler"
-  runtime          = "python3.8"
+  runtime          = "python3.12"
   timeout          = 60
   source_code_hash = data.archive_file.zip_python_code.output_base64sha256
 
@@ -86,6 +122,12 @@ resource "aws_lambda_function" "s3_compliance_checker" {
       VANGUARD_AGENT_API_URL = var.vanguard_agent_api_url
       VANGUARD_API_KEY       = var.vanguard_api_key
       SQS_QUEUE_URL          = aws_sqs_queue.remediation_trigger_queue.id
+      CONFIG_AGGREGATOR_NAME = var.config_aggregator_name
+      SECURITY_HUB_ENABLED   = var.security_hub_enabled
+      FULL_SCAN              = var.full_scan
+      MAX_WORKERS            = var.max_workers
+      ENCRYPTION_SAMPLE_SIZE = var.encryption_sample_size
+      BUCKETS_TTL            = var.buckets_ttl
     }
   }
 }
@@ -8,3 +8,39 @@ variable "vanguard_api_key" {
   type        = string
   sensitive   = true
 }
+
+variable "config_aggregator_name" {
+  description = "Name of the AWS Config aggregator used to answer bucket compliance in one query. Empty disables the fast path."
+  type        = string
+  default     = ""
+}
+
+variable "security_hub_enabled" {
+  description = "Set to \"1\" to mirror findings into Security Hub as ASFF records."
+  type        = string
+  default     = "0"
+}
+
+variable "full_scan" {
+  description = "Set to \"1\" to force the exhaustive account scan even when invoked with a Config compliance-change event."
+  type        = string
+  default     = "0"
+}
+
+variable "max_workers" {
+  description = "Width of the bucket-level worker pool; the check pool and client connection pool scale at 2x this value."
+  type        = number
+  default     = 32
+}
+
+variable "encryption_sample_size" {
+  description = "Number of buckets per scan that receive the positive-proof encryption probe (0 disables probing)."
+  type        = number
+  default     = 50
+}
+
+variable "buckets_ttl" {
+  description = "Seconds a cached bucket listing is reused across warm invocations."
+  type        = number
+  default     = 300
+}